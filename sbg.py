@@ -2,19 +2,46 @@
 import os
 import sys
 import argparse
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+import logging.handlers
+import atexit
+import hashlib
+import queue
+import time
 import subprocess
-
-logger = logging.getLogger(__name__)
+from collections import deque
+from itertools import islice
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from urllib.parse import urljoin
 
+# Named explicitly so records carry the same logger name whether this file is imported or run
+# as a script (where __name__ would be "__main__")
+logger = logging.getLogger("sbg")
+
+REQUEST_TIMEOUT = 30
+# Rate limiting (429) and transient server errors are retried by urllib3 on the pooled
+# connection, honouring GitLab's Retry-After; the final response is returned, not raised
+API_RETRY = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+                  respect_retry_after_header=True, raise_on_status=False)
+
+def positive_int(value):
+    """argparse type for options that must be an integer of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 def parse_args():
     """
     Parses command-line arguments for cloning or updating GitLab repositories.
     
     Returns:
-        argparse.Namespace: Parsed arguments including GitLab URL, access token, group IDs or paths, destination directory, and SSH usage flag.
+        argparse.Namespace: Parsed arguments including GitLab URL, access token, group IDs or paths, destination directory, SSH usage flag, number of parallel jobs, shallow/partial clone options, bare mirror mode, mirror cache directory, project listing cache settings, and subgroup path prefixes to include.
     """
     p = argparse.ArgumentParser(
         description="Clone or pull all GitLab repos under one or more groups "
@@ -30,124 +57,514 @@ def parse_args():
                    help="Destination directory to clone into")
     p.add_argument("--use-ssh", action="store_true",
                    help="Use SSH URLs instead of HTTP URLs")
+    p.add_argument("--jobs", type=positive_int, default=8,
+                   help="Number of repositories to clone or pull in parallel")
+    p.add_argument("--shallow", action="store_true",
+                   help="Clone only the latest commit (--depth 1)")
+    p.add_argument("--filter", dest="clone_filter", metavar="FILTER_SPEC",
+                   help="Partial clone filter passed to git clone, e.g. blob:none")
+    p.add_argument("--partial", dest="clone_filter", action="store_const", const="blob:none",
+                   help="Partial clone without file contents (same as --filter blob:none)")
+    p.add_argument("--mirror-cache", metavar="DIR",
+                   help="Keep bare mirrors of each project in DIR and seed new full clones from them, "
+                        "so re-cloning only transfers new objects (not used with --shallow/--filter)")
+    p.add_argument("--cache-file", metavar="PATH",
+                   help="Cache each group's project listing in PATH and reuse it on later runs")
+    p.add_argument("--cache-ttl", type=int, default=3600, metavar="SECONDS",
+                   help="How long a cached project listing stays fresh (default: 3600)")
+    p.add_argument("--mirror", action="store_true",
+                   help="Keep bare mirrors (DEST/namespace/project.git) updated with git fetch --prune "
+                        "instead of working copies")
+    p.add_argument("--include", action="append", metavar="PREFIX",
+                   help="Only descend into subgroups whose full path starts with PREFIX (repeatable)")
     return p.parse_args()
 
+def run_git(cmd, capture_stdout=False):
+    """
+    Runs a git command non-interactively.
+    
+    stdin is closed and terminal credential prompts are disabled (`GIT_TERMINAL_PROMPT=0`). ssh
+    asks for host keys and passphrases on /dev/tty instead, so unless the user chose their own
+    `GIT_SSH_COMMAND`/`GIT_SSH`, ssh runs with `BatchMode=yes`. Either way a repository that
+    needs input fails fast instead of blocking a worker forever. stdout is discarded unless
+    `capture_stdout` is set; stderr is always kept so failures can be reported.
+    Raises `subprocess.CalledProcessError` on a non-zero exit.
+    """
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    if "GIT_SSH_COMMAND" not in env and "GIT_SSH" not in env:
+        env["GIT_SSH_COMMAND"] = "ssh -o BatchMode=yes"
+    return subprocess.run(cmd, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True, check=True, env=env)
+
+def make_session(jobs=1):
+    """
+    Builds a `requests.Session` with a keep-alive pool and retries suited to `jobs` concurrent requests.
+    
+    The pool keeps a connection per concurrent request instead of discarding and re-handshaking
+    past the default pool size of 10. A cloner can have `2 * jobs` requests in flight (the
+    subgroup walk's workers plus the shared page pool), so the pool is sized for that. One
+    session can be passed to several `GitLabCloner` instances that use the same token so they
+    share warm connections.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(jobs * 2, 10), max_retries=API_RETRY)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _build_fetcher(template, stream=False, **params):
+    """
+    Returns a `GitLabCloner` method that lists one keyset-paginated endpoint for a group.
+    
+    The endpoint template and its query parameters are bound once here, so call sites only pass
+    the group id; page size and keyset ordering are filled in by `_get_pages`. With `stream=True`
+    the method yields items as pages arrive (`_get_pages`) instead of returning a list (`_get`).
+    """
+    def fetch(self, group_id):
+        get = self._get_pages if stream else self._get
+        return get(template.format(group_id=group_id), params=params, keyset=True)
+    return fetch
+
 class GitLabCloner:
-    def __init__(self, base_url, token, use_ssh):
+    # Both project listings include projects shared into the group (GitLab's default), stated
+    # explicitly so the --include walk and the single-query listing back up the same set
+    _fetch_subgroups = _build_fetcher("/api/v4/groups/{group_id}/subgroups")
+    _fetch_projects = _build_fetcher("/api/v4/groups/{group_id}/projects",
+                                     include_subgroups=False, with_shared=True, simple=True)
+    _iter_tree_projects = _build_fetcher("/api/v4/groups/{group_id}/projects", stream=True,
+                                         include_subgroups=True, with_shared=True, simple=True)
+
+    def __init__(self, base_url, token, use_ssh, jobs=1, shallow=False, clone_filter=None, session=None,
+                 mirror=False):
         self.base_url = base_url.rstrip("/") + "/"
-        self.session = requests.Session()
+        # A caller-supplied session is reused as-is (and left open by close())
+        self._owns_session = session is None
+        self.session = make_session(jobs) if session is None else session
         self.session.headers.update({"Private-Token": token})
         self.use_ssh = use_ssh
+        self.jobs = jobs
+        self.shallow = shallow
+        self.clone_filter = clone_filter
+        self.mirror = mirror
+        # Shared by every paginated call; page fetches never submit further work, so nested
+        # callers (e.g. the subgroup walk) can't deadlock waiting on it
+        self._page_pool = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="sbg-page")
+        # Per-group listings are memoized so overlapping --group-ids don't re-walk a subtree.
+        # Keys are str(group_id): ids from the CLI are strings, ids from the API are ints.
+        self._proj_cache = {}
+        self._subg_cache = {}
+
+    def close(self):
+        """Shuts down the page-fetch pool and closes the HTTP session if this cloner created it."""
+        self._page_pool.shutdown()
+        if self._owns_session:
+            self.session.close()
+
+    def _request(self, url, params=None):
+        """
+        Issues a GET and raises for status.
+        
+        `429 Too Many Requests` and transient 5xx responses are retried by the session's adapter
+        (see `API_RETRY`) before they get here, so only the calling worker waits them out.
+        """
+        r = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        return r
 
-    def _get(self, path, params=None):
+    def _get_page(self, url, params, page):
+        return self._request(url, {**params, "page": page})
+
+    def _get_pages(self, path, params=None, keyset=False):
+        """
+        Yields every item of a paginated GitLab API list endpoint, one page at a time.
+        
+        With `keyset=True` the request asks for keyset pagination (ordered by id unless the caller
+        passes its own `order_by`/`sort`), which GitLab serves with an index range scan instead of
+        an offset skip. Keyset responses carry no page count, so the `rel="next"` URL from the
+        `Link` header is followed until it is absent; this also covers offset-paginated endpoints
+        that omit the total (GitLab drops it above 10,000 records). When `x-total-pages` is present
+        (offset pagination), the remaining pages are requested concurrently instead, keeping at most
+        `self.jobs` pages in flight ahead of the consumer.
+        
+        Items are yielded as soon as their page arrives, so a caller can start work early. This
+        generator itself holds at most the current page plus `self.jobs` prefetched ones; `_get`
+        collects everything into a list instead.
+        """
         url = urljoin(self.base_url, path.lstrip("/"))
-        params = params or {}
+        params = dict(params or {})
         params.setdefault("per_page", 100)
-        items, page = [], 1
-        while True:
-            params["page"] = page
-            r = self.session.get(url, params=params)
-            r.raise_for_status()
-            chunk = r.json()
-            if not chunk:
-                break
-            items.extend(chunk)
-            if len(chunk) < params["per_page"]:
-                break
-            page += 1
-        return items
+        if keyset:
+            for key, value in (("pagination", "keyset"), ("order_by", "id"), ("sort", "asc")):
+                params.setdefault(key, value)
+        # Pages are capped at 100 `simple` records, so decoding a whole page with orjson is cheaper
+        # than an incremental parser; streaming happens at page granularity instead
+        r = self._get_page(url, params, 1)
+        yield from orjson.loads(r.content)
+        total_pages = int(r.headers.get("x-total-pages") or 1)
+        if total_pages > 1:
+            # A sliding window rather than executor.map, which would submit (and buffer) every page
+            pages = iter(range(2, total_pages + 1))
+            window = deque(self._page_pool.submit(self._get_page, url, params, page)
+                           for page in islice(pages, self.jobs))
+            try:
+                while window:
+                    r = window.popleft().result()
+                    for page in islice(pages, 1):
+                        window.append(self._page_pool.submit(self._get_page, url, params, page))
+                    yield from orjson.loads(r.content)
+            finally:
+                for future in window:
+                    future.cancel()
+        elif "x-total-pages" not in r.headers:
+            next_url = r.links.get("next", {}).get("url")
+            while next_url:
+                r = self._request(next_url)
+                yield from orjson.loads(r.content)
+                next_url = r.links.get("next", {}).get("url")
+
+    def _get(self, path, params=None, keyset=False):
+        """
+        Fetches every page of a paginated GitLab API list endpoint (see `_get_pages`).
+        
+        Returns:
+            A list of all items across all pages, in page order.
+        """
+        return list(self._get_pages(path, params, keyset))
 
     def list_subgroups(self, group_id):
-        return self._get(f"/api/v4/groups/{group_id}/subgroups")
+        key = str(group_id)
+        if key not in self._subg_cache:
+            self._subg_cache[key] = self._fetch_subgroups(group_id)
+        return self._subg_cache[key]
 
     def list_projects(self, group_id):
-        return self._get(f"/api/v4/groups/{group_id}/projects",
-                         params={"include_subgroups": False})
+        key = str(group_id)
+        if key not in self._proj_cache:
+            self._proj_cache[key] = self._fetch_projects(group_id)
+        return self._proj_cache[key]
 
-    def gather_all_projects(self, group_id):
+    def iter_all_projects_recursive(self, group_id):
+        """
+        Yields all projects within a group and its nested subgroups from a single paginated query.
+        
+        GitLab resolves the subgroup tree server-side (`include_subgroups=true`), so this costs one
+        request per page of projects rather than two requests per group in the tree. `simple=true`
+        trims each project to the basic fields (id, path, namespace, clone URLs) this tool uses.
+        Projects are yielded as each page arrives and are not kept afterwards.
+        """
+        yield from self._iter_tree_projects(group_id)
+
+    def gather_all_projects(self, group_id, includes=None):
         """
         Recursively collects all projects within a group and its nested subgroups.
         
+        Groups are walked breadth-first on a pool of `self.jobs` workers: each group's project and
+        subgroup listings are fetched concurrently, and newly discovered subgroups are submitted as
+        soon as their parent's listing returns. GitLab groups form a strict tree, so every subgroup
+        is reached exactly once and no visited set is needed.
+        
+        With `includes`, a subgroup is only walked if its `full_path` starts with one of the
+        prefixes, so excluded subtrees cost no requests. Subgroups on the way to a prefix (e.g.
+        `team` for `team/backend`) are descended into without listing their own projects. The
+        root group's projects are always listed.
+        
         Args:
             group_id: The ID of the root group to search.
+            includes: Optional list of subgroup full path prefixes to restrict the walk to.
         
         Returns:
             A list of project metadata dictionaries for all projects found under the group and its subgroups.
         """
         projects = []
-        stack, seen = [group_id], set()
-        while stack:
-            gid = stack.pop()
-            if gid in seen:
-                continue
-            seen.add(gid)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            def visit(gid, with_projects=True):
+                if with_projects:
+                    pending[executor.submit(self.list_projects, gid)] = ("projects", gid)
+                pending[executor.submit(self.list_subgroups, gid)] = ("subgroups", gid)
+
             try:
-                projs = self.list_projects(gid)
-                subs  = self.list_subgroups(gid)
-            except requests.HTTPError as error:
-                logger.warning("Could not fetch for group %s: %s", gid, error)
-                continue
-            projects.extend(projs)
-            for sg in subs:
-                stack.append(sg["id"])
+                visit(group_id)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        kind, gid = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except requests.HTTPError as error:
+                            logger.warning("Could not fetch for group %s: %s", gid, error)
+                            continue
+                        if kind == "projects":
+                            projects.extend(result)
+                            continue
+                        for sg in result:
+                            if not includes or any(sg["full_path"].startswith(p) for p in includes):
+                                visit(sg["id"])
+                            elif any(p.startswith(sg["full_path"] + "/") for p in includes):
+                                visit(sg["id"], with_projects=False)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
         return projects
 
     @staticmethod
-    def clone_or_pull(repo_url, target_path):
+    def is_up_to_date(target_path):
+        """
+        Checks whether a local repository's HEAD already matches its remote's HEAD.
+        
+        Uses `git ls-remote`, which only transfers the ref advertisement, so unchanged repos can
+        skip a full fetch and merge. Any git failure is treated as "not up to date".
+        """
+        try:
+            remote = run_git(["git", "-C", target_path, "ls-remote", "origin", "HEAD"],
+                             capture_stdout=True).stdout.split()
+            local = run_git(["git", "-C", target_path, "rev-parse", "HEAD"],
+                            capture_stdout=True).stdout.strip()
+        except subprocess.CalledProcessError:
+            return False
+        return bool(remote) and remote[0] == local
+
+    @staticmethod
+    def update_mirror(repo_url, mirror_path, level=logging.WARNING):
+        """
+        Creates or refreshes a bare mirror of a repository, as a clone reference or a backup.
+        
+        A missing mirror is created with `git clone --mirror`; an existing one is updated with
+        `git fetch --prune`. If git fails, logs at `level` (a warning by default, since a missing
+        reference only costs bandwidth) and returns False.
+        """
+        if os.path.isdir(mirror_path):
+            cmd = ["git", "-C", mirror_path, "fetch", "--prune"]
+        else:
+            cmd = ["git", "clone", "--mirror", repo_url, mirror_path]
+        try:
+            run_git(cmd)
+        except subprocess.CalledProcessError as error:
+            logger.log(level, "Mirror update failed for %s: %s\n%s",
+                       mirror_path, error, (error.stderr or "").strip())
+            return False
+        return True
+
+    def clone_or_pull(self, repo_url, target_path, reference=None):
         """
         Clones a Git repository to the target path or updates it if already present.
         
-        If the target path is an existing Git repository, performs a `git pull` to update it. Otherwise, clones the repository from the given URL into the target path. Logs errors if cloning or pulling fails.
+        An existing repository is pulled (with submodules) unless its HEAD already matches the
+        remote's; otherwise the repository and its submodules are cloned, shallow or partial if
+        `self.shallow`/`self.clone_filter` say so. Submodules are fetched `self.jobs` at a time.
+        A full clone with a `reference` mirror copies objects from it first (see `update_mirror`).
+        With `self.mirror`, only a bare mirror at `target_path + ".git"` is kept. Git failures are
+        logged with git's stderr rather than raised.
         """
-        if os.path.isdir(target_path) and os.path.isdir(os.path.join(target_path, ".git")):
+        if self.mirror:
+            logger.info("Mirroring into %s.git", target_path)
+            # here the mirror is the backup itself, so a failure is as serious as a failed clone
+            self.update_mirror(repo_url, f"{target_path}.git", level=logging.ERROR)
+            return
+        # A .git directory implies the target exists, so one stat decides clone vs pull
+        if os.path.isdir(os.path.join(target_path, ".git")):
+            if self.is_up_to_date(target_path):
+                logger.info("Already up to date: %s", target_path)
+                return
             logger.info("Updating existing repo at %s", target_path)
+            # Only clones that still borrow the mirror's objects (made before --dissociate was
+            # used) need it current; refreshing it for any other clone is a wasted fetch
+            alternates = os.path.join(target_path, ".git", "objects", "info", "alternates")
+            if reference and os.path.exists(alternates):
+                self.update_mirror(repo_url, reference)
             try:
-                subprocess.check_call(["git", "-C", target_path, "pull"])
+                run_git(["git", "-C", target_path, "pull",
+                         "--recurse-submodules", "--jobs", str(self.jobs)])
             except subprocess.CalledProcessError as error:
-                logger.error("Pull failed for %s: %s", target_path, error)
+                logger.error("Pull failed for %s: %s\n%s", target_path, error, (error.stderr or "").strip())
         else:
             logger.info("Cloning into %s", target_path)
+            cmd = ["git", "clone", "--jobs", str(self.jobs), "--recurse-submodules"]
+            if self.shallow:
+                cmd += ["--depth", "1", "--shallow-submodules"]
+            if self.clone_filter:
+                cmd.append(f"--filter={self.clone_filter}")
+            # a full-history mirror would cost more than the shallow/partial clone it feeds
+            light = self.shallow or self.clone_filter
+            if reference and not light and self.update_mirror(repo_url, reference):
+                cmd += ["--reference-if-able", reference, "--dissociate"]
             try:
-                subprocess.check_call(["git", "clone", repo_url, target_path])
+                run_git(cmd + [repo_url, target_path])
             except subprocess.CalledProcessError as error:
-                logger.error("Clone failed for %s into %s: %s", repo_url, target_path, error)
+                logger.error("Clone failed for %s into %s: %s\n%s",
+                             repo_url, target_path, error, (error.stderr or "").strip())
+
+class ProjectCache:
+    """
+    File-backed cache of per-group project listings, so warm runs can skip discovery.
+    
+    Entries are keyed by a hash of the GitLab URL, token and group id (the token itself is never
+    written), and are considered fresh for `ttl` seconds after they were stored.
+    """
+    def __init__(self, path, ttl, base_url, token):
+        self.path = path
+        self.ttl = ttl
+        self._prefix = f"{base_url.rstrip('/')}\0{token}\0"
+        try:
+            with open(path, "rb") as f:
+                self.entries = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            self.entries = {}
+        if not isinstance(self.entries, dict):
+            self.entries = {}
+
+    def _key(self, group_id):
+        return hashlib.sha256(f"{self._prefix}{group_id}".encode()).hexdigest()
+
+    def _is_fresh(self, entry):
+        return time.time() - entry["time"] < self.ttl
+
+    def get(self, group_id):
+        entry = self.entries.get(self._key(group_id))
+        return entry["projects"] if entry and self._is_fresh(entry) else None
+
+    def put(self, group_id, projects):
+        self.entries[self._key(group_id)] = {"time": time.time(), "projects": projects}
+
+    def save(self):
+        """
+        Writes fresh entries back to disk atomically (write to a temp file, then `os.replace`).
+        
+        The cache is only an optimisation, so a failed write is logged as a warning and the run
+        carries on.
+        """
+        entries = {key: entry for key, entry in self.entries.items() if self._is_fresh(entry)}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(entries))
+            os.replace(tmp_path, self.path)
+        except OSError as error:
+            logger.warning("Could not write project cache %s: %s", self.path, error)
+
+def project_namespace(proj):
+    """Returns a project's namespace path (e.g. `team/backend`), or "" for a top-level project."""
+    ns = proj.get("namespace", {}).get("full_path")
+    if not ns:
+        # fallback to path_with_namespace minus project
+        pwn = proj.get("path_with_namespace", "")
+        ns = "/".join(pwn.split("/")[:-1]) if "/" in pwn else ""
+    return ns
+
+def iter_unique_projects(cloner, group_ids, cache=None, includes=None):
+    """
+    Yields every project under the given groups, skipping projects already yielded.
+    
+    Groups are listed one after another and projects are yielded page by page as the listing
+    arrives, so callers can start work before discovery finishes. Fresh listings in `cache`
+    are used instead of the API, and new listings are stored in it. A group that can't be
+    fetched is logged and skipped (and not cached). With `includes`, each group is walked with
+    `gather_all_projects` so that only subgroups under those path prefixes are queried.
+    """
+    seen_ids = set()
+    # a group id given twice is listed once
+    for gid in dict.fromkeys(group_ids):
+        # a filtered listing must not be mistaken for the group's full listing
+        cache_key = f"{gid}\0{' '.join(sorted(includes))}" if includes else gid
+        cached = cache.get(cache_key) if cache else None
+        if cached is None:
+            logger.info("Fetching projects under group '%s' …", gid)
+        else:
+            logger.info("Using cached project listing for group '%s'", gid)
+        listed = [] if cache else None
+        try:
+            if cached is not None:
+                listing = cached
+            elif includes:
+                listing = cloner.gather_all_projects(gid, includes)
+            else:
+                listing = cloner.iter_all_projects_recursive(gid)
+            for proj in listing:
+                if listed is not None:
+                    listed.append(proj)
+                if proj["id"] not in seen_ids:
+                    seen_ids.add(proj["id"])
+                    yield proj
+        except requests.HTTPError as error:
+            logger.warning("Could not fetch for group %s: %s", gid, error)
+            continue
+        if cache and cached is None:
+            cache.put(cache_key, listed)
+
+def setup_logging():
+    """
+    Configures logging so worker threads never block on console output.
+    
+    Records are put on a queue by a `QueueHandler`; a single `QueueListener` thread writes them
+    out, and is stopped (flushing anything still queued) at interpreter exit.
+    
+    Returns:
+        The started `logging.handlers.QueueListener`.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_queue = queue.Queue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # only merge args into the message here; the listener's handler applies the real format
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler], force=True)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
 
 def main():
     """
     Clones or updates all GitLab repositories under specified groups into a local directory.
     
-    Parses command-line arguments, gathers all projects (including those in nested subgroups) for each provided group, deduplicates them, ensures the destination directory structure exists, and clones or pulls each repository into its corresponding namespace folder using either SSH or HTTP URLs.
+    Parses command-line arguments, gathers all projects (including those in nested subgroups) for each provided group, deduplicates them, ensures the destination directory structure exists, and clones or pulls the repositories in parallel (up to `--jobs` at a time) into their namespace folders using either SSH or HTTP URLs. Cloning starts as soon as the first page of projects has been listed.
     """
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    setup_logging()
     args = parse_args()
-    cloner = GitLabCloner(args.gitlab_url, args.token, args.use_ssh)
+    cloner = GitLabCloner(args.gitlab_url, args.token, args.use_ssh, jobs=args.jobs,
+                          shallow=args.shallow, clone_filter=args.clone_filter, mirror=args.mirror)
 
-    # 1) Gather & dedupe all projects
-    all_projects = {}
-    for gid in args.group_ids:
-        logger.info("Fetching projects under group '%s' …", gid)
-        for proj in cloner.gather_all_projects(gid):
-            all_projects[proj["id"]] = proj
-    logger.info("Total unique projects to process: %s", len(all_projects))
+    cache = None
+    if args.cache_file:
+        cache = ProjectCache(args.cache_file, args.cache_ttl, args.gitlab_url, args.token)
 
-    # 2) Ensure destination root exists
+    # 1) Ensure destination root exists
     dest_root = os.path.abspath(args.dest)
     os.makedirs(dest_root, exist_ok=True)
+    # --mirror keeps bare mirrors itself, so a reference cache would never be used
+    mirror_root = os.path.abspath(args.mirror_cache) if args.mirror_cache and not args.mirror else None
+    if mirror_root:
+        os.makedirs(mirror_root, exist_ok=True)
+
+    # 2) Stream deduped projects straight into the pool, so cloning overlaps listing.
+    #    Namespace folders are created here, once each, before any worker needs them.
+    parents, futures = {dest_root}, []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor, closing(cloner):
+        # Leaving the with block waits for every queued clone, so on Ctrl-C (or any error)
+        # drop the queue first; only clones already running are waited for
+        try:
+            for proj in iter_unique_projects(cloner, args.group_ids, cache, args.include):
+                ns = project_namespace(proj)
+                parent = os.path.join(dest_root, ns) if ns else dest_root
+                if parent not in parents:
+                    os.makedirs(parent, exist_ok=True)
+                    parents.add(parent)
+                target = os.path.join(parent, proj["path"])
+
+                url = proj["ssh_url_to_repo"] if args.use_ssh else proj["http_url_to_repo"]
+                reference = os.path.join(mirror_root, f"{proj['id']}.git") if mirror_root else None
+                futures.append(executor.submit(cloner.clone_or_pull, url, target, reference=reference))
+            logger.info("Total unique projects to process: %s", len(futures))
+            if cache:
+                cache.save()
 
-    # 3) Clone or pull each project into its namespace folder
-    for proj in all_projects.values():
-        ns = proj.get("namespace", {}).get("full_path")
-        if not ns:
-            # fallback to path_with_namespace minus project
-            pwn = proj.get("path_with_namespace", "")
-            ns = "/".join(pwn.split("/")[:-1]) if "/" in pwn else ""
-        project_slug = proj["path"]
-        parent = os.path.join(dest_root, ns) if ns else dest_root
-        os.makedirs(parent, exist_ok=True)
-        target = os.path.join(parent, project_slug)
-
-        url = proj["ssh_url_to_repo"] if args.use_ssh else proj["http_url_to_repo"]
-        cloner.clone_or_pull(url, target)
+            # 3) Wait for the remaining clones/pulls
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
 
 if __name__ == "__main__":
     try:
@@ -7,15 +7,41 @@ import argparse
 import requests
 from io import StringIO
 import logging
+import logging.handlers
+import threading
+import time
+import tempfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
 
 # Import the module to test
 import sbg
 
+# Keyword arguments sbg.run_git passes to subprocess.run
+GIT_KWARGS = dict(stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                  text=True, check=True,
+                  env={'GIT_SSH_COMMAND': 'ssh -o BatchMode=yes', **os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+
+
+def make_args(**overrides):
+    """Arguments as parsed from a minimal command line, so every option keeps its real default."""
+    with patch('sys.argv', ['sbg.py', '--gitlab-url', 'https://gitlab.com',
+                            '--token', 'token123', '--group-ids', '123']):
+        args = sbg.parse_args()
+    for name, value in overrides.items():
+        if not hasattr(args, name):
+            raise AttributeError(f"parse_args has no option {name!r}")
+        setattr(args, name, value)
+    return args
+
 
 class TestParseArgs(unittest.TestCase):
     @patch('sys.argv', ['sbg.py', '--gitlab-url', 'https://gitlab.com',
                         '--token', 'abc123', '--group-ids', 'group1', 'group2',
-                        '--dest', '/tmp/backup', '--use-ssh'])
+                        '--dest', '/tmp/backup', '--use-ssh', '--jobs', '4',
+                        '--shallow', '--filter', 'tree:0', '--mirror-cache', '/tmp/cache',
+                        '--cache-file', '/tmp/projects.json', '--cache-ttl', '600',
+                        '--include', 'group1/backend', '--include', 'group2', '--mirror'])
     def test_parse_args_all_options(self):
         args = sbg.parse_args()
         self.assertEqual(args.gitlab_url, 'https://gitlab.com')
@@ -23,6 +49,14 @@ class TestParseArgs(unittest.TestCase):
         self.assertEqual(args.group_ids, ['group1', 'group2'])
         self.assertEqual(args.dest, '/tmp/backup')
         self.assertTrue(args.use_ssh)
+        self.assertEqual(args.jobs, 4)
+        self.assertTrue(args.shallow)
+        self.assertEqual(args.clone_filter, 'tree:0')
+        self.assertEqual(args.mirror_cache, '/tmp/cache')
+        self.assertEqual(args.cache_file, '/tmp/projects.json')
+        self.assertEqual(args.cache_ttl, 600)
+        self.assertEqual(args.include, ['group1/backend', 'group2'])
+        self.assertTrue(args.mirror)
 
     @patch('sys.argv', ['sbg.py', '--gitlab-url', 'https://gitlab.com',
                         '--token', 'abc123', '--group-ids', 'group1'])
@@ -33,6 +67,27 @@ class TestParseArgs(unittest.TestCase):
         self.assertEqual(args.group_ids, ['group1'])
         self.assertEqual(args.dest, '.')
         self.assertFalse(args.use_ssh)
+        self.assertEqual(args.jobs, 8)
+        self.assertFalse(args.shallow)
+        self.assertIsNone(args.clone_filter)
+        self.assertIsNone(args.mirror_cache)
+        self.assertIsNone(args.cache_file)
+        self.assertEqual(args.cache_ttl, 3600)
+        self.assertIsNone(args.include)
+        self.assertFalse(args.mirror)
+
+    @patch('sys.argv', ['sbg.py', '--gitlab-url', 'https://gitlab.com',
+                        '--token', 'abc123', '--group-ids', 'group1', '--partial'])
+    def test_parse_args_partial(self):
+        args = sbg.parse_args()
+        self.assertEqual(args.clone_filter, 'blob:none')
+
+    @patch('sys.argv', ['sbg.py', '--gitlab-url', 'https://gitlab.com',
+                        '--token', 'abc123', '--group-ids', 'group1', '--jobs', '0'])
+    def test_parse_args_rejects_non_positive_jobs(self):
+        with patch('sys.stderr', new=StringIO()):
+            with self.assertRaises(SystemExit):
+                sbg.parse_args()
 
 
 class TestGitLabCloner(unittest.TestCase):
@@ -41,19 +96,36 @@ class TestGitLabCloner(unittest.TestCase):
         self.session_mock = MagicMock()
         self.cloner.session = self.session_mock
         # Configure logging for sbg.py to be captured by assertLogs
-        logging.getLogger(sbg.__name__).setLevel(logging.INFO) # Or DEBUG for more verbosity
+        logging.getLogger('sbg').setLevel(logging.INFO) # Or DEBUG for more verbosity
 
     def test_init(self):
         cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', True)
         self.assertEqual(cloner.base_url, 'https://gitlab.com/')
         self.assertEqual(cloner.session.headers.get('Private-Token'), 'token123')
         self.assertTrue(cloner.use_ssh)
+        self.assertEqual(cloner.jobs, 1)
+
+    def test_init_with_jobs(self):
+        cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', False, jobs=4)
+        self.assertEqual(cloner.jobs, 4)
+
+    def test_init_mounts_pooled_adapter(self):
+        cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', False, jobs=32)
+        self.assertEqual(cloner.session.get_adapter('https://gitlab.com')._pool_maxsize, 64)
+
+    def test_init_mounts_adapter(self):
+        # Small job counts keep requests' default pool size as a floor, on both schemes
+        cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', False, jobs=2)
+        self.assertEqual(cloner.session.get_adapter('https://gitlab.com')._pool_maxsize, 10)
+        self.assertIs(cloner.session.get_adapter('http://gitlab.local'),
+                      cloner.session.get_adapter('https://gitlab.com'))
 
     @patch('requests.Session')
     def test_get_single_page(self, session_mock):
         # Setup response mock for a single page
         response_mock = MagicMock()
-        response_mock.json.return_value = [{'id': 1}, {'id': 2}]
+        response_mock.content = json.dumps([{'id': 1}, {'id': 2}]).encode()
+        response_mock.headers = {'x-total-pages': '1'}
         session_mock.return_value.get.return_value = response_mock
 
         cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False)
@@ -64,27 +136,196 @@ class TestGitLabCloner(unittest.TestCase):
 
     @patch('requests.Session')
     def test_get_pagination(self, session_mock):
-        # Setup response mocks for pagination
-        response1 = MagicMock()
-        response1.json.return_value = [{'id': i} for i in range(100)]
-        response2 = MagicMock()
-        response2.json.return_value = [{'id': i} for i in range(100, 150)]
-        response3 = MagicMock()
-        response3.json.return_value = []
+        # Setup response mocks keyed by page, since pages 2+ are fetched concurrently
+        pages = {
+            1: [{'id': i} for i in range(100)],
+            2: [{'id': i} for i in range(100, 200)],
+            3: [{'id': i} for i in range(200, 250)],
+        }
+
+        def get(url, params=None, timeout=None):
+            response = MagicMock()
+            response.content = json.dumps(pages[params['page']]).encode()
+            response.headers = {'x-total-pages': '3'}
+            return response
+
+        session_mock.return_value.get.side_effect = get
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=4)
+        result = cloner._get('/api/v4/groups/123/projects')
+
+        self.assertEqual(result, [{'id': i} for i in range(250)])
+        self.assertEqual(session_mock.return_value.get.call_count, 3)
+        requested = sorted(c.kwargs['params']['page'] for c in session_mock.return_value.get.call_args_list)
+        self.assertEqual(requested, [1, 2, 3])
+
+    @patch('requests.Session')
+    def test_get_pages_bounds_offset_prefetch(self, session_mock):
+        def get(url, params=None, timeout=None):
+            response = MagicMock()
+            response.content = json.dumps([{'id': params['page']}]).encode()
+            response.headers = {'x-total-pages': '10'}
+            return response
+
+        session_mock.return_value.get.side_effect = get
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=2)
+        with patch.object(cloner._page_pool, 'submit', wraps=cloner._page_pool.submit) as submit_mock:
+            pages = cloner._get_pages('/api/v4/groups/123/projects')
+            self.assertEqual([next(pages), next(pages)], [{'id': 1}, {'id': 2}])
+            # The two-page window (2, 3), plus page 4 refilling it once page 2 was taken
+            self.assertEqual(submit_mock.call_count, 3)
+            pages.close()
+        cloner.close()
+
+    @patch('requests.Session')
+    def test_get_pages_is_lazy(self, session_mock):
+        response = MagicMock()
+        response.content = json.dumps([{'id': 1}, {'id': 2}]).encode()
+        response.headers = {}
+        response.links = {'next': {'url': 'https://gitlab.com/api/v4/groups/123/projects?cursor=abc'}}
+        session_mock.return_value.get.side_effect = [response, AssertionError("second page requested")]
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False)
+        for item in cloner._get_pages('/api/v4/groups/123/projects', keyset=True):
+            break
+
+        self.assertEqual(item, {'id': 1})
+        session_mock.return_value.get.assert_called_once()
+
+    @patch('requests.Session')
+    def test_get_keyset_pagination(self, session_mock):
+        # Keyset responses carry no page count; the Link rel="next" URL is followed verbatim
+        next_urls = ['https://gitlab.com/api/v4/groups/123/projects?cursor=abc',
+                     'https://gitlab.com/api/v4/groups/123/projects?cursor=def']
+        responses = []
+        for start, next_url in zip((0, 100, 200), next_urls + [None]):
+            response = MagicMock()
+            response.content = json.dumps([{'id': i} for i in range(start, start + 100)]).encode()
+            response.headers = {}
+            response.links = {'next': {'url': next_url, 'rel': 'next'}} if next_url else {}
+            responses.append(response)
+
+        session_mock.return_value.get.side_effect = responses
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False)
+        result = cloner._get('/api/v4/groups/123/projects', keyset=True)
+
+        self.assertEqual(result, [{'id': i} for i in range(300)])
+        first, second, third = session_mock.return_value.get.call_args_list
+        self.assertEqual(first.kwargs['params']['per_page'], 100)
+        self.assertEqual(first.kwargs['params']['pagination'], 'keyset')
+        self.assertEqual(first.kwargs['params']['order_by'], 'id')
+        self.assertEqual(second, call(next_urls[0], params=None, timeout=sbg.REQUEST_TIMEOUT))
+        self.assertEqual(third, call(next_urls[1], params=None, timeout=sbg.REQUEST_TIMEOUT))
+
+    @patch('requests.Session')
+    def test_get_without_links_stops_after_one_call(self, session_mock):
+        # Endpoints without keyset support or a page count end after the first page
+        response = MagicMock()
+        response.content = json.dumps([{'id': 1}]).encode()
+        response.headers = {}
+        response.links = {}
+        session_mock.return_value.get.return_value = response
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False)
+        result = cloner._get('/api/v4/groups/123/subgroups', keyset=True)
+
+        self.assertEqual(result, [{'id': 1}])
+        session_mock.return_value.get.assert_called_once()
 
-        session_mock.return_value.get.side_effect = [response1, response2, response3]
+    @patch('requests.Session')
+    def test_get_keyset_keeps_caller_ordering(self, session_mock):
+        response = MagicMock()
+        response.content = b'[]'
+        response.headers = {}
+        response.links = {}
+        session_mock.return_value.get.return_value = response
 
         cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False)
+        cloner._get('/api/v4/projects', params={'order_by': 'updated_at', 'sort': 'desc'}, keyset=True)
+
+        params = session_mock.return_value.get.call_args.kwargs['params']
+        self.assertEqual(params['order_by'], 'updated_at')
+        self.assertEqual(params['sort'], 'desc')
+        self.assertEqual(params['pagination'], 'keyset')
+
+    def test_session_is_shared_when_passed(self):
+        session = sbg.make_session(jobs=4)
+        c1 = sbg.GitLabCloner('https://gitlab.com/', 'token123', False, session=session)
+        c2 = sbg.GitLabCloner('https://gitlab.com/', 'token123', False, session=session)
+
+        self.assertIs(c1.session, c2.session)
+        self.assertEqual(session.headers.get('Private-Token'), 'token123')
+
+        with patch.object(session, 'close') as close_mock:
+            c1.close()
+        close_mock.assert_not_called()
+
+    def test_own_session_closed(self):
+        cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', False)
+        with patch.object(cloner.session, 'close') as close_mock:
+            cloner.close()
+        close_mock.assert_called_once()
+
+    @patch('urllib3.util.retry.time.sleep')
+    def test_get_retries_transient_errors_on_session(self, sleep_mock):
+        # A real local server answers 503 twice before succeeding
+        attempts = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                attempts.append(self.path)
+                if len(attempts) <= 2:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = b'[{"id": 1}]'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('x-total-pages', '1')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        cloner = sbg.GitLabCloner(f'http://127.0.0.1:{server.server_port}', 'token123', False)
+        self.addCleanup(cloner.close)
         result = cloner._get('/api/v4/groups/123/projects')
 
-        self.assertEqual(len(result), 150)
-        self.assertEqual(session_mock.return_value.get.call_count, 2)
+        self.assertEqual(result, [{'id': 1}])
+        self.assertEqual(len(attempts), 3)
+
+    def test_close_shuts_down_page_pool(self):
+        cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', False, jobs=2)
+        cloner.close()
+        with self.assertRaises(RuntimeError):
+            cloner._page_pool.submit(print)
+
+    def test_init_mounts_retrying_adapter(self):
+        cloner = sbg.GitLabCloner('https://gitlab.com/', 'token123', False)
+        retry = cloner.session.get_adapter('https://gitlab.com').max_retries
+        self.assertIn(429, retry.status_forcelist)
+        self.assertIn(503, retry.status_forcelist)
+        self.assertNotIn(500, retry.status_forcelist)
+        self.assertEqual(retry.backoff_factor, 0.5)
+        self.assertTrue(retry.respect_retry_after_header)
+        self.assertFalse(retry.raise_on_status)
 
     def test_list_subgroups(self):
         self.cloner._get = MagicMock(return_value=[{'id': 10}, {'id': 11}])
         result = self.cloner.list_subgroups(123)
 
-        self.cloner._get.assert_called_once_with('/api/v4/groups/123/subgroups')
+        self.cloner._get.assert_called_once_with('/api/v4/groups/123/subgroups', params={}, keyset=True)
         self.assertEqual(result, [{'id': 10}, {'id': 11}])
 
     def test_list_projects(self):
@@ -92,100 +333,424 @@ class TestGitLabCloner(unittest.TestCase):
         result = self.cloner.list_projects(123)
 
         self.cloner._get.assert_called_once_with('/api/v4/groups/123/projects',
-                                                 params={'include_subgroups': False})
+                                                 params={'include_subgroups': False, 'with_shared': True,
+                                                         'simple': True},
+                                                 keyset=True)
         self.assertEqual(result, [{'id': 101}, {'id': 102}])
 
-    def test_gather_all_projects(self):
-        # Mock responses for different API calls
-        def side_effect(path, params=None):
-            if 'subgroups' in path:
-                if '123' in path:
-                    return [{'id': 456}, {'id': 789}]
-                return []
-            elif 'projects' in path:
-                if '123' in path:
-                    return [{'id': 1, 'name': 'Project1'}]
-                elif '456' in path:
-                    return [{'id': 2, 'name': 'Project2'}]
-                elif '789' in path:
-                    return [{'id': 3, 'name': 'Project3'}]
+    def test_listings_use_specialized_fetchers(self):
+        with patch.object(sbg.GitLabCloner, '_fetch_subgroups', return_value=[{'id': 10}]) as subgroups_mock, \
+                patch.object(sbg.GitLabCloner, '_fetch_projects', return_value=[{'id': 101}]) as projects_mock, \
+                patch.object(sbg.GitLabCloner, '_iter_tree_projects', return_value=iter([{'id': 102}])) as tree_mock:
+            self.assertEqual(self.cloner.list_subgroups(123), [{'id': 10}])
+            self.assertEqual(self.cloner.list_projects(123), [{'id': 101}])
+            self.assertEqual(list(self.cloner.iter_all_projects_recursive(123)), [{'id': 102}])
+
+        subgroups_mock.assert_called_once_with(123)
+        projects_mock.assert_called_once_with(123)
+        tree_mock.assert_called_once_with(123)
+
+    def test_list_subgroups_cached(self):
+        self.cloner._get = MagicMock(return_value=[{'id': 10}])
+        self.cloner.list_subgroups(123)
+        result = self.cloner.list_subgroups(123)
+
+        self.cloner._get.assert_called_once()
+        self.assertEqual(result, [{'id': 10}])
+
+    def test_list_subgroups_cache_ignores_id_type(self):
+        # Group ids come from the CLI as strings and from the API as ints
+        self.cloner._get = MagicMock(return_value=[])
+        self.cloner.list_subgroups(456)
+        self.cloner.list_subgroups('456')
+
+        self.cloner._get.assert_called_once()
+
+    def test_iter_all_projects_recursive_streams(self):
+        self.cloner._get_pages = MagicMock(return_value=iter([{'id': 101}, {'id': 102}]))
+
+        projects = self.cloner.iter_all_projects_recursive(123)
+        self.assertEqual(next(projects), {'id': 101})
+        self.assertEqual(list(projects), [{'id': 102}])
+
+    def test_list_projects_cached(self):
+        self.cloner._get = MagicMock(return_value=[{'id': 101}])
+        self.cloner.list_projects(123)
+        result = self.cloner.list_projects(123)
+
+        self.cloner._get.assert_called_once()
+        self.assertEqual(result, [{'id': 101}])
+
+    def test_gather_all_projects_overlapping_groups(self):
+        # Walking a subgroup after its parent reuses the cached listings
+        def side_effect(path, params=None, keyset=False):
+            if path == '/api/v4/groups/123/subgroups':
+                return [{'id': 456}]
+            if path == '/api/v4/groups/123/projects':
+                return [{'id': 1}]
+            if path == '/api/v4/groups/456/projects':
+                return [{'id': 2}]
             return []
 
         self.cloner._get = MagicMock(side_effect=side_effect)
-        result = self.cloner.gather_all_projects(123)
+        self.cloner.gather_all_projects(123)
+        result = self.cloner.gather_all_projects(456)
+
+        self.assertEqual(result, [{'id': 2}])
+        self.assertEqual(self.cloner._get.call_count, 4)
+
+    def test_iter_all_projects_recursive_query(self):
+        self.cloner._get_pages = MagicMock(return_value=[{'id': 101}, {'id': 102}])
+        result = list(self.cloner.iter_all_projects_recursive(123))
+
+        self.cloner._get_pages.assert_called_once_with('/api/v4/groups/123/projects',
+                                                 params={'include_subgroups': True, 'with_shared': True,
+                                                         'simple': True},
+                                                 keyset=True)
+        self.assertEqual(result, [{'id': 101}, {'id': 102}])
+
+    def test_gather_all_projects(self):
+        # Responses keyed by path, since groups are fetched concurrently in no fixed order
+        responses = {
+            '/api/v4/groups/123/subgroups': [{'id': 456}, {'id': 789}],
+            '/api/v4/groups/123/projects': [{'id': 1, 'name': 'Project1'}],
+            '/api/v4/groups/456/projects': [{'id': 2, 'name': 'Project2'}],
+            '/api/v4/groups/789/projects': [{'id': 3, 'name': 'Project3'}],
+        }
+
+        def side_effect(path, params=None, keyset=False):
+            return responses.get(path, [])
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=4)
+        cloner._get = MagicMock(side_effect=side_effect)
+        result = cloner.gather_all_projects(123)
 
         # Should have 3 projects from main group and 2 subgroups
         self.assertEqual(len(result), 3)
         self.assertEqual({p['id'] for p in result}, {1, 2, 3})
 
+    def test_gather_all_projects_fetches_listings_concurrently(self):
+        # Both listings of the root group must be in flight at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def side_effect(path, params=None, keyset=False):
+            if '/groups/1/' in path:
+                barrier.wait()
+            return [{'id': 2}] if path == '/api/v4/groups/1/subgroups' else []
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=2)
+        cloner._get = MagicMock(side_effect=side_effect)
+
+        self.assertEqual(cloner.gather_all_projects(1), [])
+        self.assertEqual(cloner._get.call_count, 4)
+
+    def test_gather_all_projects_parallel_deep_tree(self):
+        # 1 -> (2, 3), 2 -> (4,), each group owning one project with id = group id * 10
+        tree = {1: [2, 3], 2: [4], 3: [], 4: []}
+
+        def side_effect(path, params=None, keyset=False):
+            gid = int(path.split('/')[4])
+            if path.endswith('subgroups'):
+                return [{'id': sg} for sg in tree[gid]]
+            return [{'id': gid * 10}]
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=4)
+        cloner._get = MagicMock(side_effect=side_effect)
+        result = cloner.gather_all_projects(1)
+
+        self.assertEqual({p['id'] for p in result}, {10, 20, 30, 40})
+        self.assertEqual(cloner._get.call_count, 8)
+
+    def test_gather_respects_include_prefix(self):
+        responses = {
+            '/api/v4/groups/1/subgroups': [{'id': 2, 'full_path': 'top/backend'},
+                                           {'id': 3, 'full_path': 'top/frontend'}],
+            '/api/v4/groups/1/projects': [{'id': 10}],
+            '/api/v4/groups/2/projects': [{'id': 20}],
+        }
+
+        def side_effect(path, params=None, keyset=False):
+            return responses.get(path, [])
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=2)
+        cloner._get = MagicMock(side_effect=side_effect)
+        result = cloner.gather_all_projects(1, includes=['top/back'])
+
+        self.assertEqual({p['id'] for p in result}, {10, 20})
+        queried = [c.args[0] for c in cloner._get.call_args_list]
+        self.assertFalse(any('/groups/3/' in path for path in queried))
+
+    def test_gather_descends_through_ancestors_of_include_prefix(self):
+        responses = {
+            '/api/v4/groups/1/subgroups': [{'id': 2, 'full_path': 'top/team'}],
+            '/api/v4/groups/2/subgroups': [{'id': 3, 'full_path': 'top/team/backend'},
+                                           {'id': 4, 'full_path': 'top/team/frontend'}],
+            '/api/v4/groups/2/projects': [{'id': 20}],
+            '/api/v4/groups/3/projects': [{'id': 30}],
+        }
+
+        def side_effect(path, params=None, keyset=False):
+            return responses.get(path, [])
+
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, jobs=2)
+        cloner._get = MagicMock(side_effect=side_effect)
+        result = cloner.gather_all_projects(1, includes=['top/team/backend'])
+
+        self.assertEqual([p['id'] for p in result], [30])
+        queried = [c.args[0] for c in cloner._get.call_args_list]
+        self.assertNotIn('/api/v4/groups/2/projects', queried)
+        self.assertFalse(any('/groups/4/' in path for path in queried))
+
     def test_gather_all_projects_with_http_error(self):
         # Test handling of HTTP errors for some groups
-        def side_effect(path, params=None):
-            if '123' in path:
-                if 'subgroups' in path:
-                    return [{'id': 456}, {'id': 789}]
-                else:
-                    return [{'id': 1, 'name': 'Project1'}]
-            elif '456' in path:
-                raise requests.HTTPError("Not found")
-            elif '789' in path and 'projects' in path:
-                return [{'id': 3, 'name': 'Project3'}]
-            return []
+        responses = {
+            '/api/v4/groups/123/subgroups': [{'id': 456}, {'id': 789}],
+            '/api/v4/groups/123/projects': [{'id': 1, 'name': 'Project1'}],
+            '/api/v4/groups/456/subgroups': requests.HTTPError("Not found"),
+            '/api/v4/groups/456/projects': requests.HTTPError("Not found"),
+            '/api/v4/groups/789/projects': [{'id': 3, 'name': 'Project3'}],
+        }
+
+        def side_effect(path, params=None, keyset=False):
+            response = responses.get(path, [])
+            if isinstance(response, Exception):
+                raise response
+            return response
 
         self.cloner._get = MagicMock(side_effect=side_effect)
 
-        with self.assertLogs(logging.getLogger(sbg.__name__), level='WARNING') as cm:
+        with self.assertLogs('sbg', level='WARNING') as cm:
             result = self.cloner.gather_all_projects(123)
 
         # Should have 2 projects and a warning
         self.assertEqual(len(result), 2)
         self.assertTrue(any("Could not fetch for group 456" in message for message in cm.output))
 
-    @patch('subprocess.check_call')
+    @patch('subprocess.run')
     @patch('os.path.isdir')
     def test_clone_new_repo(self, isdir_mock, subprocess_mock):
         # Mock that target directory doesn't exist
         isdir_mock.return_value = False
+        base = ['git', 'clone', '--jobs', '1', '--recurse-submodules']
+        repo = ['https://gitlab.com/user/repo.git', '/tmp/repo']
+        cases = [
+            (False, None, []),
+            (True, None, ['--depth', '1', '--shallow-submodules']),
+            (False, 'blob:none', ['--filter=blob:none']),
+            (True, 'blob:none', ['--depth', '1', '--shallow-submodules', '--filter=blob:none']),
+        ]
+
+        for shallow, clone_filter, extra in cases:
+            with self.subTest(shallow=shallow, clone_filter=clone_filter):
+                subprocess_mock.reset_mock()
+                isdir_mock.reset_mock()
+                cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False,
+                                          shallow=shallow, clone_filter=clone_filter)
 
-        sbg.GitLabCloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+                cloner.clone_or_pull(*repo)
 
-        subprocess_mock.assert_called_once_with(['git', 'clone',
-                                                 'https://gitlab.com/user/repo.git', '/tmp/repo'])
+                isdir_mock.assert_called_once_with('/tmp/repo/.git')
+                subprocess_mock.assert_called_once_with(base + extra + repo, **GIT_KWARGS)
 
-    @patch('subprocess.check_call')
+    @patch('subprocess.run')
+    @patch('os.path.isdir')
+    def test_clone_with_mirror_reference(self, isdir_mock, subprocess_mock):
+        isdir_mock.return_value = False
+
+        self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo',
+                                  reference='/tmp/cache/1.git')
+
+        self.assertEqual(subprocess_mock.call_args_list, [
+            call(['git', 'clone', '--mirror', 'https://gitlab.com/user/repo.git', '/tmp/cache/1.git'],
+                 **GIT_KWARGS),
+            call(['git', 'clone', '--jobs', '1', '--recurse-submodules',
+                  '--reference-if-able', '/tmp/cache/1.git', '--dissociate',
+                  'https://gitlab.com/user/repo.git', '/tmp/repo'],
+                 **GIT_KWARGS),
+        ])
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir', return_value=False)
+    def test_light_clone_skips_mirror_reference(self, isdir_mock, subprocess_mock):
+        for shallow, clone_filter in ((True, None), (False, 'blob:none')):
+            with self.subTest(shallow=shallow, clone_filter=clone_filter):
+                subprocess_mock.reset_mock()
+                cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False,
+                                          shallow=shallow, clone_filter=clone_filter)
+
+                cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo',
+                                     reference='/tmp/cache/1.git')
+
+                subprocess_mock.assert_called_once()
+                self.assertNotIn('--mirror', subprocess_mock.call_args.args[0])
+                self.assertNotIn('--reference-if-able', subprocess_mock.call_args.args[0])
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir')
+    def test_update_existing_mirror(self, isdir_mock, subprocess_mock):
+        isdir_mock.return_value = True
+
+        self.assertTrue(sbg.GitLabCloner.update_mirror('https://gitlab.com/user/repo.git', '/tmp/cache/1.git'))
+
+        subprocess_mock.assert_called_once_with(['git', '-C', '/tmp/cache/1.git', 'fetch', '--prune'],
+                                                **GIT_KWARGS)
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir')
+    def test_clone_without_reference_when_mirror_fails(self, isdir_mock, subprocess_mock):
+        isdir_mock.return_value = False
+        subprocess_mock.side_effect = [subprocess.CalledProcessError(128, 'git clone --mirror'), MagicMock()]
+
+        with self.assertLogs('sbg', level='WARNING') as cm:
+            self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo',
+                                      reference='/tmp/cache/1.git')
+
+        self.assertTrue(any("Mirror update failed for /tmp/cache/1.git" in message for message in cm.output))
+        subprocess_mock.assert_called_with(['git', 'clone', '--jobs', '1', '--recurse-submodules',
+                                            'https://gitlab.com/user/repo.git', '/tmp/repo'],
+                                           **GIT_KWARGS)
+
+    @patch('subprocess.run')
     @patch('os.path.isdir')
     def test_pull_existing_repo(self, isdir_mock, subprocess_mock):
-        # Mock that target directory exists and is a git repo
+        # Mock that target directory exists and is a git repo behind its remote
         isdir_mock.side_effect = lambda path: True
+        subprocess_mock.side_effect = [
+            subprocess.CompletedProcess([], 0, stdout='bbbb\tHEAD\n'),
+            subprocess.CompletedProcess([], 0, stdout='aaaa\n'),
+            subprocess.CompletedProcess([], 0),
+        ]
+
+        self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
 
-        sbg.GitLabCloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+        isdir_mock.assert_called_once_with('/tmp/repo/.git')
+        self.assertEqual(subprocess_mock.call_count, 3)
+        subprocess_mock.assert_called_with(['git', '-C', '/tmp/repo', 'pull',
+                                            '--recurse-submodules', '--jobs', '1'],
+                                           **GIT_KWARGS)
 
-        subprocess_mock.assert_called_once_with(['git', '-C', '/tmp/repo', 'pull'])
+    @patch('subprocess.run')
+    @patch('os.path.exists', return_value=False)
+    @patch('os.path.isdir', return_value=True)
+    def test_pull_skips_mirror_without_alternates(self, isdir_mock, exists_mock, subprocess_mock):
+        subprocess_mock.side_effect = [
+            subprocess.CompletedProcess([], 0, stdout='bbbb\tHEAD\n'),
+            subprocess.CompletedProcess([], 0, stdout='aaaa\n'),
+            subprocess.CompletedProcess([], 0),
+        ]
+
+        self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo',
+                                  reference='/tmp/cache/1.git')
 
-    @patch('subprocess.check_call')
+        exists_mock.assert_called_once_with('/tmp/repo/.git/objects/info/alternates')
+        self.assertEqual(subprocess_mock.call_count, 3)
+        subprocess_mock.assert_called_with(['git', '-C', '/tmp/repo', 'pull',
+                                            '--recurse-submodules', '--jobs', '1'],
+                                           **GIT_KWARGS)
+
+    @patch('subprocess.run')
+    @patch('os.path.exists', return_value=True)
+    @patch('os.path.isdir', return_value=True)
+    def test_pull_refreshes_mirror_borrowed_through_alternates(self, isdir_mock, exists_mock, subprocess_mock):
+        subprocess_mock.side_effect = [
+            subprocess.CompletedProcess([], 0, stdout='bbbb\tHEAD\n'),
+            subprocess.CompletedProcess([], 0, stdout='aaaa\n'),
+            subprocess.CompletedProcess([], 0),
+            subprocess.CompletedProcess([], 0),
+        ]
+
+        self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo',
+                                  reference='/tmp/cache/1.git')
+
+        self.assertEqual(subprocess_mock.call_args_list[2],
+                         call(['git', '-C', '/tmp/cache/1.git', 'fetch', '--prune'], **GIT_KWARGS))
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir', return_value=False)
+    def test_mirror_mode_failure_is_an_error(self, isdir_mock, subprocess_mock):
+        subprocess_mock.side_effect = subprocess.CalledProcessError(128, 'git clone --mirror',
+                                                                    stderr='fatal: repository not found\n')
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, mirror=True)
+
+        with self.assertLogs('sbg', level='ERROR') as cm:
+            cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+
+        self.assertTrue(any(message.startswith("ERROR:sbg:Mirror update failed for /tmp/repo.git")
+                            for message in cm.output))
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir')
+    def test_mirror_mode_clones_bare_mirror(self, isdir_mock, subprocess_mock):
+        isdir_mock.return_value = False
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, mirror=True)
+
+        cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+
+        subprocess_mock.assert_called_once_with(['git', 'clone', '--mirror',
+                                                 'https://gitlab.com/user/repo.git', '/tmp/repo.git'],
+                                                **GIT_KWARGS)
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir')
+    def test_mirror_mode_fetches_existing_mirror(self, isdir_mock, subprocess_mock):
+        isdir_mock.return_value = True
+        cloner = sbg.GitLabCloner('https://gitlab.com', 'token123', False, mirror=True)
+
+        cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+
+        isdir_mock.assert_called_once_with('/tmp/repo.git')
+        subprocess_mock.assert_called_once_with(['git', '-C', '/tmp/repo.git', 'fetch', '--prune'],
+                                                **GIT_KWARGS)
+
+    @patch('subprocess.run')
+    @patch('os.path.isdir')
+    def test_skip_up_to_date_repo(self, isdir_mock, subprocess_mock):
+        isdir_mock.side_effect = lambda path: True
+        subprocess_mock.side_effect = [
+            subprocess.CompletedProcess([], 0, stdout='aaaa\tHEAD\n'),
+            subprocess.CompletedProcess([], 0, stdout='aaaa\n'),
+        ]
+
+        with self.assertLogs('sbg', level='INFO') as cm:
+            self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+
+        self.assertEqual(subprocess_mock.call_count, 2)
+        subprocess_mock.assert_any_call(['git', '-C', '/tmp/repo', 'ls-remote', 'origin', 'HEAD'],
+                                        **dict(GIT_KWARGS, stdout=subprocess.PIPE))
+        self.assertTrue(any("Already up to date: /tmp/repo" in message for message in cm.output))
+
+    @patch('subprocess.run')
+    def test_is_up_to_date_on_git_error(self, subprocess_mock):
+        subprocess_mock.side_effect = subprocess.CalledProcessError(128, 'git ls-remote')
+        self.assertFalse(sbg.GitLabCloner.is_up_to_date('/tmp/repo'))
+
+    @patch('subprocess.run')
     @patch('os.path.isdir')
     def test_clone_error_handling(self, isdir_mock, subprocess_mock):
         # Mock that target directory doesn't exist but clone fails
         isdir_mock.return_value = False
-        subprocess_mock.side_effect = subprocess.CalledProcessError(1, 'git clone')
+        subprocess_mock.side_effect = subprocess.CalledProcessError(1, 'git clone',
+                                                                    stderr='fatal: repository not found\n')
 
-        with self.assertLogs(logging.getLogger(sbg.__name__), level='ERROR') as cm:
-            sbg.GitLabCloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
+        with self.assertLogs('sbg', level='ERROR') as cm:
+            self.cloner.clone_or_pull('https://gitlab.com/user/repo.git', '/tmp/repo')
 
         self.assertTrue(any("Clone failed for https://gitlab.com/user/repo.git into /tmp/repo" in message for message in cm.output))
+        self.assertTrue(any("fatal: repository not found" in message for message in cm.output))
 
 
+@patch('sbg.setup_logging')
 @patch('sbg.GitLabCloner')
 @patch('os.makedirs')
 @patch('os.path.abspath')
 class TestMain(unittest.TestCase):
-    def test_main_with_multiple_groups(self, abspath_mock, makedirs_mock, cloner_class_mock):
+    def test_main_with_multiple_groups(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
         # Setup mocks
         abspath_mock.return_value = '/absolute/path'
 
         cloner_instance = cloner_class_mock.return_value
         # Mock projects from two groups
-        cloner_instance.gather_all_projects.side_effect = [
+        cloner_instance.iter_all_projects_recursive.side_effect = [
             [{'id': 1, 'path': 'project1', 'namespace': {'full_path': 'group1'},
               'http_url_to_repo': 'http://gitlab.com/group1/project1.git'}],
             [{'id': 2, 'path': 'project2', 'namespace': {'full_path': 'group2'},
@@ -193,41 +758,36 @@ class TestMain(unittest.TestCase):
         ]
 
         # Setup and run main
-        args = MagicMock()
-        args.gitlab_url = 'https://gitlab.com'
-        args.token = 'token123'
-        args.group_ids = ['123', '456']
-        args.dest = '/backup'
-        args.use_ssh = False
+        args = make_args(group_ids=['123', '456'], dest='/backup', jobs=2)
 
         with patch('sbg.parse_args', return_value=args):
             with patch('sys.stdout', new=StringIO()):  # Suppress print statements
                 sbg.main()
 
-        # Verify
-        self.assertEqual(cloner_instance.gather_all_projects.call_count, 2)
-        self.assertEqual(makedirs_mock.call_count, 3)  # Root + 2 namespaces
-        self.assertEqual(cloner_instance.clone_or_pull.call_count, 2)
+        # Verify; projects are cloned in parallel, so compare calls regardless of order
+        self.assertEqual(cloner_instance.iter_all_projects_recursive.call_count, 2)
+        unique_namespaces = {'group1', 'group2'}
+        self.assertEqual(makedirs_mock.call_count, 1 + len(unique_namespaces))  # Root + each namespace
+        cloner_instance.close.assert_called_once()
+        self.assertCountEqual(cloner_instance.clone_or_pull.call_args_list, [
+            call('http://gitlab.com/group1/project1.git', '/absolute/path/group1/project1', reference=None),
+            call('http://gitlab.com/group2/project2.git', '/absolute/path/group2/project2', reference=None),
+        ])
 
-    def test_main_with_path_with_namespace_fallback(self, abspath_mock, makedirs_mock, cloner_class_mock):
+    def test_main_with_path_with_namespace_fallback(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
         # Test namespace fallback when namespace field is missing
         abspath_mock.return_value = '/absolute/path'
 
         cloner_instance = cloner_class_mock.return_value
         # Project with path_with_namespace but no namespace field
-        cloner_instance.gather_all_projects.return_value = [
+        cloner_instance.iter_all_projects_recursive.return_value = [
             {'id': 1, 'path': 'project1',
              'path_with_namespace': 'group1/subgroup/project1',
              'http_url_to_repo': 'http://gitlab.com/group1/subgroup/project1.git'}
         ]
 
         # Setup and run main
-        args = MagicMock()
-        args.gitlab_url = 'https://gitlab.com'
-        args.token = 'token123'
-        args.group_ids = ['123']
-        args.dest = '/backup'
-        args.use_ssh = False
+        args = make_args(dest='/backup', jobs=2)
 
         with patch('sbg.parse_args', return_value=args):
             with patch('sys.stdout', new=StringIO()):  # Suppress print statements
@@ -237,35 +797,327 @@ class TestMain(unittest.TestCase):
         expected_parent = '/absolute/path/group1/subgroup'
         makedirs_mock.assert_any_call(expected_parent, exist_ok=True)
 
-    def test_main_with_ssh_urls(self, abspath_mock, makedirs_mock, cloner_class_mock):
+    def test_main_with_ssh_urls(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
         # Test that SSH URLs are used when use_ssh is True
         abspath_mock.return_value = '/absolute/path'
 
         cloner_instance = cloner_class_mock.return_value
-        cloner_instance.gather_all_projects.return_value = [
+        cloner_instance.iter_all_projects_recursive.return_value = [
             {'id': 1, 'path': 'project1', 'namespace': {'full_path': 'group1'},
              'http_url_to_repo': 'http://gitlab.com/group1/project1.git',
              'ssh_url_to_repo': 'git@gitlab.com:group1/project1.git'}
         ]
 
         # Setup and run main with use_ssh=True
-        args = MagicMock()
-        args.gitlab_url = 'https://gitlab.com'
-        args.token = 'token123'
-        args.group_ids = ['123']
-        args.dest = '/backup'
-        args.use_ssh = True
+        args = make_args(dest='/backup', use_ssh=True, jobs=2)
 
         with patch('sbg.parse_args', return_value=args):
             with patch('sys.stdout', new=StringIO()):
                 sbg.main()
 
         # Verify SSH URL is used
-        cloner_instance.clone_or_pull.assert_called_with(
+        cloner_instance.clone_or_pull.assert_called_once_with(
             'git@gitlab.com:group1/project1.git',
-            '/absolute/path/group1/project1'
+            '/absolute/path/group1/project1',
+            reference=None
+        )
+
+
+    def test_main_creates_each_namespace_once(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
+        abspath_mock.return_value = '/absolute/path'
+
+        cloner_instance = cloner_class_mock.return_value
+        cloner_instance.iter_all_projects_recursive.return_value = [
+            {'id': i, 'path': f'project{i}', 'namespace': {'full_path': 'group1'},
+             'http_url_to_repo': f'http://gitlab.com/group1/project{i}.git'}
+            for i in range(5)
+        ]
+
+        args = make_args(dest='/backup', jobs=2)
+
+        with patch('sbg.parse_args', return_value=args):
+            sbg.main()
+
+        self.assertEqual(makedirs_mock.call_args_list, [
+            call('/absolute/path', exist_ok=True),
+            call('/absolute/path/group1', exist_ok=True),
+        ])
+        self.assertEqual(cloner_instance.clone_or_pull.call_count, 5)
+
+    def test_main_with_mirror_cache(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
+        abspath_mock.side_effect = lambda path: '/absolute' + path
+
+        cloner_instance = cloner_class_mock.return_value
+        cloner_instance.iter_all_projects_recursive.return_value = [
+            {'id': 7, 'path': 'project1', 'namespace': {'full_path': 'group1'},
+             'http_url_to_repo': 'http://gitlab.com/group1/project1.git'}
+        ]
+
+        args = make_args(dest='/backup', jobs=2, mirror_cache='/cache')
+
+        with patch('sbg.parse_args', return_value=args):
+            sbg.main()
+
+        makedirs_mock.assert_any_call('/absolute/cache', exist_ok=True)
+        cloner_instance.clone_or_pull.assert_called_once_with(
+            'http://gitlab.com/group1/project1.git',
+            '/absolute/backup/group1/project1',
+            reference='/absolute/cache/7.git'
+        )
+
+    def test_main_mirror_mode_ignores_mirror_cache(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
+        abspath_mock.side_effect = lambda path: '/absolute' + path
+
+        cloner_instance = cloner_class_mock.return_value
+        cloner_instance.iter_all_projects_recursive.return_value = [
+            {'id': 7, 'path': 'project1', 'namespace': {'full_path': 'group1'},
+             'http_url_to_repo': 'http://gitlab.com/group1/project1.git'}
+        ]
+
+        args = make_args(dest='/backup', jobs=2, mirror_cache='/cache', mirror=True)
+
+        with patch('sbg.parse_args', return_value=args):
+            sbg.main()
+
+        self.assertNotIn(call('/absolute/cache', exist_ok=True), makedirs_mock.call_args_list)
+        cloner_instance.clone_or_pull.assert_called_once_with(
+            'http://gitlab.com/group1/project1.git',
+            '/absolute/backup/group1/project1',
+            reference=None
+        )
+
+    def test_main_with_warm_cache_skips_discovery(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
+        abspath_mock.return_value = '/absolute/path'
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache_file = os.path.join(tmp.name, 'projects.json')
+        cache = sbg.ProjectCache(cache_file, 60, 'https://gitlab.com', 'token123')
+        cache.put('123', [{'id': 1, 'path': 'project1', 'namespace': {'full_path': 'group1'},
+                           'http_url_to_repo': 'http://gitlab.com/group1/project1.git'}])
+        cache.save()
+
+        cloner_instance = cloner_class_mock.return_value
+
+        args = make_args(dest='/backup', jobs=2, cache_file=cache_file, cache_ttl=60)
+
+        with patch('sbg.parse_args', return_value=args):
+            sbg.main()
+
+        cloner_instance.iter_all_projects_recursive.assert_not_called()
+        cloner_instance.clone_or_pull.assert_called_once_with(
+            'http://gitlab.com/group1/project1.git',
+            '/absolute/path/group1/project1',
+            reference=None
+        )
+
+    def test_main_skips_group_with_http_error(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
+        abspath_mock.return_value = '/absolute/path'
+
+        cloner_instance = cloner_class_mock.return_value
+        cloner_instance.iter_all_projects_recursive.side_effect = [
+            requests.HTTPError("Not found"),
+            [{'id': 2, 'path': 'project2', 'namespace': {'full_path': 'group2'},
+              'http_url_to_repo': 'http://gitlab.com/group2/project2.git'}]
+        ]
+
+        args = make_args(group_ids=['123', '456'], dest='/backup', jobs=2)
+
+        with patch('sbg.parse_args', return_value=args):
+            with self.assertLogs('sbg', level='WARNING') as cm:
+                sbg.main()
+
+        self.assertTrue(any("Could not fetch for group 123" in message for message in cm.output))
+        cloner_instance.clone_or_pull.assert_called_once_with(
+            'http://gitlab.com/group2/project2.git',
+            '/absolute/path/group2/project2',
+            reference=None
         )
 
+    def test_main_interrupt_cancels_queued_clones(self, abspath_mock, makedirs_mock, cloner_class_mock, setup_logging_mock):
+        abspath_mock.return_value = '/absolute/path'
+
+        def listing():
+            for pid in (1, 2, 3):
+                yield {'id': pid, 'path': f'project{pid}', 'namespace': {'full_path': 'group1'},
+                       'http_url_to_repo': f'http://gitlab.com/group1/project{pid}.git'}
+            raise KeyboardInterrupt
+
+        cloner_instance = cloner_class_mock.return_value
+        cloner_instance.iter_all_projects_recursive.side_effect = [listing()]
+        # Keeps the single worker busy until the interrupt has reached main
+        cloner_instance.clone_or_pull.side_effect = lambda *a, **kw: time.sleep(0.2)
+
+        args = make_args(dest='/backup', jobs=1)
+
+        with patch('sbg.parse_args', return_value=args):
+            with self.assertRaises(KeyboardInterrupt):
+                sbg.main()
+
+        cloner_instance.clone_or_pull.assert_called_once()
+        cloner_instance.close.assert_called_once()
+
+
+class TestRunGit(unittest.TestCase):
+    @patch('subprocess.run')
+    def test_captures_stdout_on_request(self, subprocess_mock):
+        sbg.run_git(['git', 'rev-parse', 'HEAD'], capture_stdout=True)
+        subprocess_mock.assert_called_once_with(['git', 'rev-parse', 'HEAD'],
+                                                **dict(GIT_KWARGS, stdout=subprocess.PIPE))
+
+    @patch('subprocess.run')
+    def test_keeps_user_ssh_command(self, subprocess_mock):
+        with patch.dict(os.environ, {'GIT_SSH_COMMAND': 'ssh -i key'}):
+            sbg.run_git(['git', 'fetch'])
+
+        self.assertEqual(subprocess_mock.call_args.kwargs['env']['GIT_SSH_COMMAND'], 'ssh -i key')
+
+
+class TestProjectNamespace(unittest.TestCase):
+    def test_prefers_namespace_full_path(self):
+        proj = {'namespace': {'full_path': 'team/backend'}, 'path_with_namespace': 'other/api'}
+        self.assertEqual(sbg.project_namespace(proj), 'team/backend')
+
+    def test_falls_back_to_path_with_namespace(self):
+        self.assertEqual(sbg.project_namespace({'path_with_namespace': 'team/backend/api'}), 'team/backend')
+        self.assertEqual(sbg.project_namespace({'path_with_namespace': 'api'}), '')
+
+
+class TestIterUniqueProjects(unittest.TestCase):
+    def test_skips_group_failing_mid_listing(self):
+        def failing():
+            yield {'id': 1}
+            raise requests.HTTPError("502 Bad Gateway")
+
+        cloner = MagicMock()
+        cloner.iter_all_projects_recursive.side_effect = [failing(), [{'id': 2}]]
+
+        with self.assertLogs('sbg', level='WARNING') as cm:
+            result = list(sbg.iter_unique_projects(cloner, ['123', '456']))
+
+        self.assertEqual(result, [{'id': 1}, {'id': 2}])
+        self.assertTrue(any("Could not fetch for group 123" in message for message in cm.output))
+
+    def test_dedupes_across_groups(self):
+        cloner = MagicMock()
+        cloner.iter_all_projects_recursive.side_effect = [
+            [{'id': 1}, {'id': 2}],
+            [{'id': 2}, {'id': 3}],
+        ]
+
+        result = list(sbg.iter_unique_projects(cloner, ['123', '456']))
+
+        self.assertEqual(result, [{'id': 1}, {'id': 2}, {'id': 3}])
+
+    def test_lists_repeated_group_once(self):
+        cloner = MagicMock()
+        cloner.iter_all_projects_recursive.return_value = [{'id': 1}]
+
+        result = list(sbg.iter_unique_projects(cloner, ['123', '123']))
+
+        self.assertEqual(result, [{'id': 1}])
+        cloner.iter_all_projects_recursive.assert_called_once_with('123')
+
+    def test_yields_before_listing_next_group(self):
+        cloner = MagicMock()
+        cloner.iter_all_projects_recursive.side_effect = [[{'id': 1}], [{'id': 2}]]
+
+        projects = sbg.iter_unique_projects(cloner, ['123', '456'])
+        self.assertEqual(next(projects), {'id': 1})
+
+        cloner.iter_all_projects_recursive.assert_called_once_with('123')
+
+    def test_walks_tree_when_includes_given(self):
+        cloner = MagicMock()
+        cloner.gather_all_projects.return_value = [{'id': 1}]
+
+        result = list(sbg.iter_unique_projects(cloner, ['123'], includes=['team/backend']))
+
+        self.assertEqual(result, [{'id': 1}])
+        cloner.gather_all_projects.assert_called_once_with('123', ['team/backend'])
+        cloner.iter_all_projects_recursive.assert_not_called()
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'projects.json')
+
+    def test_round_trip(self):
+        cache = sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123')
+        cache.put('123', [{'id': 1}])
+        cache.save()
+
+        reloaded = sbg.ProjectCache(self.path, 60, 'https://gitlab.com/', 'token123')
+        self.assertEqual(reloaded.get('123'), [{'id': 1}])
+        self.assertIsNone(reloaded.get('456'))
+        with open(self.path) as f:
+            self.assertNotIn('token123', f.read())
+
+    def test_entries_are_scoped_to_token(self):
+        cache = sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123')
+        cache.put('123', [{'id': 1}])
+        cache.save()
+
+        other = sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'other-token')
+        self.assertIsNone(other.get('123'))
+
+    def test_expired_entries_are_ignored(self):
+        cache = sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123')
+        cache.put('123', [{'id': 1}])
+        cache.save()
+
+        with patch('time.time', return_value=time.time() + 120):
+            self.assertIsNone(sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123').get('123'))
+
+    def test_unreadable_file_starts_empty(self):
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        self.assertEqual(sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123').entries, {})
+
+    def test_non_object_file_starts_empty(self):
+        with open(self.path, 'w') as f:
+            f.write('[]')
+        self.assertEqual(sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123').entries, {})
+
+    def test_unwritable_path_only_warns(self):
+        path = os.path.join(os.path.dirname(self.path), 'missing', 'projects.json')
+        cache = sbg.ProjectCache(path, 60, 'https://gitlab.com', 'token123')
+        cache.put('123', [{'id': 1}])
+
+        with self.assertLogs('sbg', level='WARNING') as cm:
+            cache.save()
+
+        self.assertTrue(any(f"Could not write project cache {path}" in message for message in cm.output))
+
+    def test_iter_unique_projects_uses_cache(self):
+        cache = sbg.ProjectCache(self.path, 60, 'https://gitlab.com', 'token123')
+        cache.put('123', [{'id': 1}])
+        cloner = MagicMock()
+        cloner.iter_all_projects_recursive.return_value = [{'id': 2}]
+
+        result = list(sbg.iter_unique_projects(cloner, ['123', '456'], cache))
+
+        self.assertEqual(result, [{'id': 1}, {'id': 2}])
+        cloner.iter_all_projects_recursive.assert_called_once_with('456')
+        self.assertEqual(cache.get('456'), [{'id': 2}])
+
+
+class TestSetupLogging(unittest.TestCase):
+    def tearDown(self):
+        logging.basicConfig(force=True)
+
+    @patch('atexit.register')
+    def test_records_go_through_queue_listener(self, register_mock):
+        stream = StringIO()
+        with patch('sys.stderr', new=stream):
+            listener = sbg.setup_logging()
+            self.assertIsInstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+            sbg.logger.info("hello from %s", "worker")
+            listener.stop()
+
+        register_mock.assert_called_once_with(listener.stop)
+        self.assertIn("INFO - hello from worker", stream.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main()